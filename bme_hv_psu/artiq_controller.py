@@ -5,18 +5,25 @@ ARTIQ controller to interface with a BME high-voltage power supply and log its
 status data to InfluxDB.
 """
 
-from asyncio import sleep
+from asyncio import Event, TimeoutError as AsyncioTimeoutError, sleep, wait_for
 from artiq.tools import atexit_register_coroutine
-from llama.influxdb import aggregate_stats_default
 from llama.rpc import add_chunker_methods, run_simple_rpc_server
 from llama.channels import ChunkedChannel
-from .driver import I2CInterface, StateType
+from .driver import I2CInterface, StateType, StatusFlag
 from .poller import Poller
 import logging
 import math
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+#: Factor to scale the raw 12-bit analogue read-back values pushed by the
+#: Poller to [0, 1]; applied once per bin rather than once per sample.
+_INV_4095 = 1.0 / (2**12 - 1)
+
+#: Squared scale factor, for the sum-of-squares (variance) term.
+_INV_4095_SQ = _INV_4095 * _INV_4095
+
 def setup_args(parser):
     parser.add_argument("--i2c-bus-idx", default=None, type=int, required=True,
                         help="index of the I2C bus to use (cf. /dev/i2c-<n>).")
@@ -27,6 +34,26 @@ def setup_args(parser):
                         help="highest voltage output by the particular hw model, in volts")
 
 
+def _merge_partial_aggregates(partials):
+    """
+    Merge the (count, sum, sum of squares, min, max) partial aggregates of
+    raw 12-bit values pushed by the Poller into a single stats dict for
+    InfluxDB, scaled to [0, 1].
+    """
+    arr = np.asarray(partials, dtype=np.float64)
+    count = arr[:, 0].sum()
+    mean = arr[:, 1].sum() / count * _INV_4095
+    # Clamp to zero to guard against floating-point cancellation for
+    # near-constant samples.
+    var = max(0.0, arr[:, 2].sum() / count * _INV_4095_SQ - mean * mean)
+    return {
+        "mean": float(mean),
+        "std": math.sqrt(var),
+        "min": float(arr[:, 3].min()) * _INV_4095,
+        "max": float(arr[:, 4].max()) * _INV_4095
+    }
+
+
 def setup_interface(args, influx_pusher, loop):
     i2c = I2CInterface(args.i2c_bus_idx, args.i2c_dev_addr)
 
@@ -35,7 +62,7 @@ def setup_interface(args, influx_pusher, loop):
     def add(name, ty) -> None:
         def bin_finished(values):
             if influx_pusher:
-                influx_pusher.push(name, aggregate_stats_default(values))
+                influx_pusher.push(name, _merge_partial_aggregates(values))
         channels[ty] = ChunkedChannel(name, bin_finished, 256, 30, loop)
 
     # TODO: Better names once deduced what these actually are.
@@ -49,10 +76,25 @@ def setup_interface(args, influx_pusher, loop):
     add("u_24v", StateType.u_24v)
     add("ratio", StateType.ratio)
 
-    callbacks = {}
-    for ty, chunker in channels.items():
-        callbacks[ty] = lambda x, chunker=chunker: chunker.push(x)
-    callbacks[StateType.status_flags] = lambda x: logger.warn("Status flags changed: %s", x)
+    # Pass the bound push methods directly rather than wrapping them in
+    # another closure, saving a Python-level call per state update.
+    callbacks = {ty: chunker.push for ty, chunker in channels.items()}
+
+    # Events tracking the last high-voltage on/off state reported by the
+    # hardware, so that control requests can wait for the state they target
+    # instead of sleeping for the worst-case duration. Both start unset, as
+    # the hardware only sends the status flags when they change.
+    hv_state_events = {True: Event(), False: Event()}
+
+    def status_flags_changed(flags):
+        # Skip the logging machinery outright when nothing would be emitted;
+        # a faulting device can spam flag changes at the full polling rate.
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning("Status flags changed: %s", flags)
+        hv_on = StatusFlag.hv_on in flags
+        hv_state_events[hv_on].set()
+        hv_state_events[not hv_on].clear()
+    callbacks[StateType.status_flags] = status_flags_changed
     poller = Poller(i2c, callbacks)
     atexit_register_coroutine(poller.stop)
 
@@ -63,6 +105,21 @@ def setup_interface(args, influx_pusher, loop):
             # status flag field when it changes. Thus, we have to do the wait
             # the first time after startup (signified by None).
             self._set_point_volts = None
+            self._voltage_factor = args.voltage_factor
+
+        async def _wait_for_hv(self, target, timeout=2.0):
+            """
+            Wait until the hardware reports the high-voltage stage as
+            enabled/disabled via the status flags, up to the given timeout.
+
+            Returns early as soon as the status update arrives; if none does
+            (e.g. right after startup, before the first flag change has been
+            observed), this degrades to the previous fixed-delay behaviour.
+            """
+            try:
+                await wait_for(hv_state_events[target].wait(), timeout)
+            except AsyncioTimeoutError:
+                pass
 
         async def get_voltage(self):
             """
@@ -90,19 +147,27 @@ def setup_interface(args, influx_pusher, loop):
 
             if set_point_volts < 0.0:
                 raise ValueError("Output voltage cannot be negative")
-            if set_point_volts > args.voltage_factor:
+            if set_point_volts > self._voltage_factor:
                 raise ValueError("Output voltage cannot exceed {} V".format(
-                    args.voltage_factor))
+                    self._voltage_factor))
 
             first = self._set_point_volts is None
+            changed = first or not math.isclose(self._set_point_volts,
+                                                set_point_volts)
+
             if set_point_volts > 0.0 and (first or self._set_point_volts == 0.0):
                 await poller.enable_hv(True)
 
                 # The hardware implements some sort of soft-start mechanism,
-                # only enabling the output after about one second.
-                await sleep(2.0)
+                # only enabling the output after about one second; wait for
+                # the status flags to confirm rather than assuming the worst
+                # case.
+                await self._wait_for_hv(True)
 
-            await poller.set_hv_set_point(set_point_volts / args.voltage_factor)
+            if changed:
+                # Skip the I2C transaction entirely for no-op requests.
+                await poller.set_hv_set_point(
+                    set_point_volts / self._voltage_factor)
 
             if set_point_volts == 0.0 and (first or self._set_point_volts > 0.0):
                 # Give the hardware some time to ramp down the voltage, as
@@ -112,10 +177,9 @@ def setup_interface(args, influx_pusher, loop):
                 await sleep(2.0)
                 await poller.enable_hv(False)
 
-            previous_volts = self._set_point_volts
             self._set_point_volts = set_point_volts
 
-            return first or not math.isclose(previous_volts, set_point_volts)
+            return changed
 
         async def reset_fault(self):
             """
@@ -123,11 +187,12 @@ def setup_interface(args, influx_pusher, loop):
             occurred (e.g. over-current/-temperature), allowing the output
             to be enabled again.
 
-            Also disables the output (which, in case the hardware is actually
-            in a failure state, would have already occurred).
+            Also zeroes the set point and disables the output (which, in case
+            the hardware is actually in a failure state, would have already
+            occurred), all in a single hardware transaction.
             """
-            await self.set_voltage(0.0)
             await poller.reset_fault()
+            self._set_point_volts = 0.0
 
     rpc_interface = Interface()
     for c in channels.values():
@@ -136,6 +201,14 @@ def setup_interface(args, influx_pusher, loop):
 
 
 def main():
+    # Use the libuv-based event loop when available; the polling hot path is
+    # largely asyncio scheduler overhead, which uvloop cuts substantially.
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     run_simple_rpc_server(4009, setup_args, "hv_psu", setup_interface)
 
 
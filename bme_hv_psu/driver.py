@@ -11,7 +11,7 @@ import struct
 
 from enum import Enum, unique
 from fcntl import ioctl
-from typing import AbstractSet, Optional, Tuple, Union
+from typing import AbstractSet, List, Optional, Tuple, Union
 
 
 # These magic numbers must match the Linux kernel headers and do not seem to be
@@ -232,6 +232,26 @@ class I2CInterface:
             # msg_type.
             return state_type, (struct.unpack(">H", response[0:2])[0] & 0x0FFF)
 
+    def read_state_updates(self, max_updates: int) -> \
+            List[Tuple[ControlFlag, Union[int, AbstractSet[StatusFlag]]]]:
+        """
+        Read a batch of up to max_updates state updates from the hardware.
+
+        Stops early once the hardware signals that no more data is pending.
+        This allows callers that poll from another thread to amortise the
+        dispatch overhead over several reads.
+
+        :returns: A list of (StateType, <value>) tuples as per
+            read_state_update(), possibly empty.
+        """
+        updates = []
+        for _ in range(max_updates):
+            update = self.read_state_update()
+            if update is None:
+                break
+            updates.append(update)
+        return updates
+
     def write_control_flags(self, flags: AbstractSet[ControlFlag]) -> None:
         """
         Write the given control flags to the hardware.
@@ -6,7 +6,9 @@ commands.
 
 import logging
 from . import driver
-from asyncio import AbstractEventLoop, CancelledError, get_event_loop, Lock, sleep
+from asyncio import (AbstractEventLoop, CancelledError, Event, get_event_loop,
+                     get_running_loop, sleep)
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from typing import Callable, Mapping
 
@@ -14,10 +16,19 @@ logger = logging.getLogger(__name__)
 
 
 class Poller:
+    #: Pre-built control flag sets, so the control methods do not need to
+    #: allocate one per invocation (write_control_flags accepts any
+    #: AbstractSet).
+    _HV_ON_FLAGS = frozenset({driver.ControlFlag.hv_on})
+    _RESET_FLAGS = frozenset({driver.ControlFlag.reset})
+    _NO_FLAGS = frozenset()
+
     def __init__(self,
                  interface: driver.I2CInterface,
                  callbacks_for_states: Mapping[driver.StateType, Callable[[float], None]],
                  polling_interval: float=0.01,
+                 batch_size: int=8,
+                 aggregate_every: int=16,
                  loop: AbstractEventLoop=None):
         """
         Initialise a new Poller instance.
@@ -26,23 +37,86 @@ class Poller:
             exclusive ownership of the object and might operate on it from a
             background thread.
         :param callbacks_for_states: A map from hardware status update
-            driver.StateTypes to callbacks to invoke with the new value when
-            they occur.
+            driver.StateTypes to callbacks. The status_flags callback is
+            invoked with the new set of flags as soon as it arrives; analogue
+            read-back callbacks receive partial aggregates in the form of
+            (count, sum, sum of squares, min, max) tuples over the raw 12-bit
+            integer values (see aggregate_every). Scaling to physical units is
+            left to the consumer, keeping the hot path free of float
+            allocations.
         :param polling_interval: The target interval between polling the
             hardware for state updates, in seconds. The actual interval might
             be longer if the event loop is busy.
+        :param batch_size: The maximum number of state updates to read from
+            the hardware per poll, amortising the cost of dispatching to the
+            background thread over several reads.
+        :param aggregate_every: The number of analogue read-back samples to
+            fold into a partial aggregate before invoking the respective
+            callback, amortising the callback dispatch overhead. Any remainder
+            is flushed when the poller is stopped.
         :param loop: The event loop to use (None for asyncio default).
         """
         self._interface = interface
-        self._callbacks_for_states = callbacks_for_states
         self.polling_interval = polling_interval
-        self._loop = loop if loop else get_event_loop()
+        self._batch_size = batch_size
+        self._aggregate_every = aggregate_every
+        if loop:
+            self._loop = loop
+        else:
+            # Prefer get_running_loop(), which skips the policy indirection
+            # get_event_loop() goes through.
+            try:
+                self._loop = get_running_loop()
+            except RuntimeError:
+                self._loop = get_event_loop()
+
+        # Cache bound methods used in the hot path to shorten the attribute
+        # lookup chains there.
+        self._loop_time = self._loop.time
+        self._run_in_executor = self._loop.run_in_executor
+
+        # Pre-compute the callback dispatch table so the poll loop does not
+        # need to allocate a closure or branch on the state type for every
+        # single update. status_flags is the only non-analogue type, so it
+        # gets a dedicated slot instead of a second table.
+        self._scaled_callbacks = {
+            ty: cb for ty, cb in callbacks_for_states.items()
+            if ty is not driver.StateType.status_flags
+        }
+        self._status_callback = callbacks_for_states.get(
+            driver.StateType.status_flags)
+
+        # Partial aggregates [count, sum, sum of squares, min, max] of the
+        # raw 12-bit analogue values, per state type, accumulated until
+        # aggregate_every samples have been seen. Keeping these integral
+        # means small values hit CPython's small-int cache instead of
+        # allocating a fresh float per sample.
+        self._partials = {}
 
-        # Hardware communication lock.
-        self._interface_lock = Lock()
+        # Back off the polling interval by up to this factor while the
+        # hardware is quiet (no new data, or only repeats of the last value).
+        self._max_idle_mult = 10
+        self._idle_streak = 0
+        self._last_values = {}
+
+        # Hardware communication gate. A plain flag suffices as everything is
+        # scheduled from the event-loop thread; the common case (the poll loop
+        # running with no concurrent control request) then skips the future
+        # and waiter-list bookkeeping an asyncio.Lock would do on every
+        # acquisition. The event is only touched on actual contention.
+        self._interface_busy = False
+        self._interface_idle = Event()
+        self._interface_idle.set()
 
         self._shutdown = False
 
+        # Hardware access is serialised anyway, so use a single dedicated
+        # worker thread instead of the (much larger) default executor pool;
+        # one pinned thread stays warm and avoids scheduling jitter between
+        # polls.
+        self._hw_executor = ThreadPoolExecutor(max_workers=1,
+                                               thread_name_prefix="bme-i2c")
+
         # Start polling in a background coroutine.
         self._poll_task = self._loop.create_task(self._run_poll_loop())
 
@@ -53,13 +127,14 @@ class Poller:
         self._shutdown = True
         with suppress(CancelledError):
             await self._poll_task
+        self._hw_executor.shutdown(wait=True)
 
     async def enable_hv(self, enabled: bool) -> None:
         """
         Enable or disable the hardware high-voltage output stage.
         """
-        await self._run_on_hardware(lambda i: i.write_control_flags(
-            {driver.ControlFlag.hv_on} if enabled else set()))
+        await self._run_on_hardware_sync(lambda i: i.write_control_flags(
+            self._HV_ON_FLAGS if enabled else self._NO_FLAGS))
 
     async def set_hv_set_point(self, value: float) -> None:
         """
@@ -75,38 +150,126 @@ class Poller:
         if value < 0 or value > 1:
             raise ValueError("High-voltage set point must be between 0 and 1.")
 
-        await self._run_on_hardware(lambda i: i.write_hv_set_point(int(
+        await self._run_on_hardware_sync(lambda i: i.write_hv_set_point(int(
             round(value * (2**12 - 1)))))
 
     async def reset_fault(self) -> None:
         """
-        Disable the high-voltage output and clears the hardware fault status.
+        Zero the set point, disable the high-voltage output and clear the
+        hardware fault status, as a single hardware transaction.
         """
         def write(i: driver.I2CInterface):
-            i.write_control_flags({driver.ControlFlag.reset})
-            i.write_control_flags(set())
-        await self._run_on_hardware(write)
+            i.write_hv_set_point(0)
+            i.write_control_flags(self._RESET_FLAGS)
+            i.write_control_flags(self._NO_FLAGS)
+        await self._run_on_hardware_sync(write)
 
     async def _run_poll_loop(self) -> None:
         """
         Run the idle poll loop.
         """
+        # Bind hot attributes to locals once, outside the loop, to avoid the
+        # repeated lookups at the polling rate.
+        batch_size = self._batch_size
+        read_updates = lambda i: i.read_state_updates(batch_size)
+        scaled_callbacks = self._scaled_callbacks
+        status_callback = self._status_callback
+        status_flags_ty = driver.StateType.status_flags
+        run_on_hardware = self._run_on_hardware
+        loop_time = self._loop_time
+        last_values = self._last_values
+        partials = self._partials
+        aggregate_every = self._aggregate_every
+
         while not self._shutdown:
-            last_poll_time = self._loop.time()
+            last_poll_time = loop_time()
+
+            # An empty batch means no data was pending on the hardware side.
+            idle = True
+            for ty, val in await run_on_hardware(read_updates):
+                cb = scaled_callbacks.get(ty)
+                if cb is not None:
+                    if last_values.get(ty) != val:
+                        idle = False
+                    last_values[ty] = val
 
-            ty, val = await self._run_on_hardware(lambda i: i.read_state_update())
-            if ty in self._callbacks_for_states:
-                if ty != driver.StateType.status_flags:
-                    val /= 2**12 - 1
-                self._callbacks_for_states[ty](val)
+                    partial = partials.get(ty)
+                    if partial is None:
+                        partial = partials[ty] = [0, 0, 0, val, val]
+                    partial[0] += 1
+                    partial[1] += val
+                    partial[2] += val * val
+                    if val < partial[3]:
+                        partial[3] = val
+                    elif val > partial[4]:
+                        partial[4] = val
+                    if partial[0] >= aggregate_every:
+                        cb(tuple(partial))
+                        del partials[ty]
+                elif ty is status_flags_ty and status_callback is not None:
+                    status_callback(val)
+                    if last_values.get(ty) != val:
+                        idle = False
+                    last_values[ty] = val
 
-            elapsed = self._loop.time() - last_poll_time
-            await sleep(max(0.0, self.polling_interval - elapsed))
+            if idle:
+                if self._idle_streak < self._max_idle_mult - 1:
+                    self._idle_streak += 1
+            else:
+                self._idle_streak = 0
+            interval = self.polling_interval * (1 + self._idle_streak)
+
+            remaining = interval - (loop_time() - last_poll_time)
+            if remaining <= 1e-6:
+                # Hardware access already ate the whole interval (or all but a
+                # negligible sliver of it); just yield to the scheduler
+                # without going through the timer heap.
+                await sleep(0)
+            else:
+                await sleep(remaining)
+
+        # Flush any accumulated partial aggregates so stopping the poller does
+        # not silently drop buffered samples.
+        for ty, partial in partials.items():
+            scaled_callbacks[ty](tuple(partial))
+        partials.clear()
+
+    async def _acquire_interface(self) -> None:
+        while self._interface_busy:
+            self._interface_idle.clear()
+            await self._interface_idle.wait()
+        self._interface_busy = True
+
+    def _release_interface(self) -> None:
+        self._interface_busy = False
+        if not self._interface_idle.is_set():
+            self._interface_idle.set()
 
     async def _run_on_hardware(self, fun):
         """
         Execute the passed function on a background thread, passing the hardware
         driver I2CInterface as a parameter and serialising access to it.
         """
-        with (await self._interface_lock):
-            return await self._loop.run_in_executor(None, fun, self._interface)
+        await self._acquire_interface()
+        try:
+            return await self._run_in_executor(self._hw_executor, fun,
+                                               self._interface)
+        finally:
+            self._release_interface()
+
+    async def _run_on_hardware_sync(self, fun):
+        """
+        Execute the passed function directly on the event-loop thread, passing
+        the hardware driver I2CInterface as a parameter and serialising access
+        to it.
+
+        This skips the thread-pool round trip of _run_on_hardware, which would
+        dwarf the cost of a small I2C write; it must only be used for
+        operations guaranteed to complete quickly (well under a millisecond),
+        as they block the event loop.
+        """
+        await self._acquire_interface()
+        try:
+            return fun(self._interface)
+        finally:
+            self._release_interface()
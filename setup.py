@@ -11,6 +11,10 @@ setup(
     },
     install_requires=[
 		'artiq',
-        'llama'
-    ]
+        'llama',
+        'numpy'
+    ],
+    extras_require={
+        'fast': ['uvloop']
+    }
 )